@@ -1,64 +1,102 @@
 """
 This script is designed to process and organize image and label data for training deep learning models.
-It includes functionality to combine image and label files from separate train, validation, and test
-folders into unified directories, and then splits the data into new train, validation, and test sets
-based on specified ratios.
+It gathers matching image and label files from separate train, validation, and test folders and splits
+them into new train, validation, and test sets based on specified ratios, linking each file straight from
+its source folder into the new split without an intermediate combined copy.
 
 Functions:
 -----------
-1. combine_data(data_dir, image_dir, label_dir):
-   - Combines images and corresponding label files from 'train', 'valid', and 'test' subdirectories
-     into unified "all_images" and "all_labels" directories for easier processing.
-
-2. split_data(image_dir, label_dir, output_dir, train_ratio=0.6, val_ratio=0.2, test_ratio=0.2):
-   - Splits the combined image and label data into new train, validation, and test sets based on the
-     specified ratios. Ensures each image has a corresponding label and organizes the data into
-     output directories.
+1. gather_pairs(data_dir):
+   - Collects (image path, label path) pairs from the 'train', 'valid', and 'test' subdirectories,
+     skipping images that have no corresponding label file.
+
+2. split_data(data_dir, output_dir, train_ratio=0.6, val_ratio=0.2, test_ratio=0.2):
+   - Splits the gathered image and label pairs into new train, validation, and test sets based on the
+     specified ratios and organizes the data into output directories.
 """
 
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from sklearn.model_selection import train_test_split #type: ignore
 
 # Paths
 data_dir = "data/drowning"
-image_dir = os.path.join(data_dir, "all_images")
-label_dir = os.path.join(data_dir, "all_labels")
 
-# Combine all images and labels into one folder
-def combine_data(data_dir, image_dir, label_dir):
+def copy_file(src, dst):
     """
-    Combines the images and labels into 2 folders in the same directory
+    Copies src to dst inside the kernel with copy_file_range (which can reflink on btrfs/xfs),
+    falling back to shutil.copyfile's sendfile path where it is unavailable or fails
+    """
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        # Nothing copied before reaching the full size; let shutil redo the copy
+                        raise OSError("copy_file_range stopped before the end of the file")
+                    remaining -= copied
+            return
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+
+def link_or_copy(src, dst):
+    """
+    Hardlinks src to dst so no file data is duplicated, copying only when linking fails
+    (e.g. across devices or on filesystems without hardlink support)
+    """
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        # Replace stale outputs from a previous run instead of writing through a link into the source
+        os.remove(dst)
+        link_or_copy(src, dst)
+    except OSError:
+        copy_file(src, dst)
+
+# Collect all image and label pairs
+def gather_pairs(data_dir):
+    """
+    Gathers the (image path, label path) pairs from the train, valid and test folders.
+    Images sharing a filename across folders are kept once, the last folder winning
     """
-    os.makedirs(image_dir, exist_ok=True)
-    os.makedirs(label_dir, exist_ok=True)
-
     # Subdirectories to process
     subdirs = ["train", "valid", "test"]
 
+    # Keyed by image filename so duplicates can't end up in more than one split
+    pairs = {}
     for subdir in subdirs:
         sub_image_dir = os.path.join(data_dir, subdir, "images")
         sub_label_dir = os.path.join(data_dir, subdir, "labels")
 
-        for image_fname in os.listdir(sub_image_dir):
-            # Copy image
-            shutil.copy(os.path.join(sub_image_dir, image_fname), os.path.join(image_dir, image_fname))
+        # One directory scan for labels instead of an exists() check per image
+        with os.scandir(sub_label_dir) as entries:
+            label_fnames = {entry.name for entry in entries if entry.is_file()}
+
+        with os.scandir(sub_image_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                image_fname = entry.name
 
-            # Match corresponding label file
-            base_name = os.path.splitext(image_fname)[0]  # Get the base name (without extension)
-            label_fname = f"{base_name}.txt"  # Assuming labels have a `.txt` extension
-            label_path = os.path.join(sub_label_dir, label_fname)
+                # Match corresponding label file
+                base_name = os.path.splitext(image_fname)[0]  # Get the base name (without extension)
+                label_fname = f"{base_name}.txt"  # Assuming labels have a `.txt` extension
 
-            if os.path.exists(label_path):
-                shutil.copy(label_path, os.path.join(label_dir, label_fname))
-            else:
-                print(f"Warning: Label file not found for image {image_fname}")
+                if label_fname in label_fnames:
+                    if image_fname in pairs:
+                        print(f"Warning: Duplicate image {image_fname}, keeping the one in {subdir}")
+                    pairs[image_fname] = (entry.path, os.path.join(sub_label_dir, label_fname))
+                else:
+                    print(f"Warning: Label file not found for image {image_fname}")
 
-# Combine all data
-combine_data(data_dir, image_dir, label_dir)
+    return list(pairs.values())
 
 # Split into new train, validation, and test sets
-def split_data(image_dir, label_dir, output_dir, train_ratio=0.6, val_ratio=0.2, test_ratio=0.2):
+def split_data(data_dir, output_dir, train_ratio=0.6, val_ratio=0.2, test_ratio=0.2):
     """
     Split the data into desired ratios
     """
@@ -71,53 +109,43 @@ def split_data(image_dir, label_dir, output_dir, train_ratio=0.6, val_ratio=0.2,
         os.makedirs(os.path.join(output_dir, split, "images"), exist_ok=True)
         os.makedirs(os.path.join(output_dir, split, "labels"), exist_ok=True)
 
-    # Get all filenames
-    image_files = sorted(os.listdir(image_dir))
-    label_files = sorted(os.listdir(label_dir))
+    # Directory order is arbitrary, so sort once by image filename (not by source folder)
+    # to keep the seeded split below reproducible
+    matched_files = sorted(gather_pairs(data_dir), key=lambda pair: os.path.basename(pair[0]))
 
-    # Match image and label files by base name
-    image_base_names = [os.path.splitext(fname)[0] for fname in image_files]
-    label_base_names = [os.path.splitext(fname)[0] for fname in label_files]
-
-    # Ensure every image has a corresponding label
-    matched_files = [
-        (image_files[i], f"{image_base_names[i]}.txt")
-        for i in range(len(image_files))
-        if image_base_names[i] in label_base_names
-    ]
-
-    # Extract matched filenames
-    image_files = [image for image, label in matched_files]
-    label_files = [label for image, label in matched_files]
-
-    # Split filenames
-    train_images, temp_images, train_labels, temp_labels = train_test_split(
-        image_files, label_files, test_size=val_ratio + test_ratio, random_state=42
+    # Split the (image, label) pairs together; labels follow their images without a second list to shuffle
+    train_files, temp_files = train_test_split(
+        matched_files, test_size=val_ratio + test_ratio, random_state=42
     )
-    val_images, test_images, val_labels, test_labels = train_test_split(
-        temp_images, temp_labels, test_size=test_ratio / (val_ratio + test_ratio), random_state=42
+    val_files, test_files = train_test_split(
+        temp_files, test_size=test_ratio / (val_ratio + test_ratio), random_state=42
     )
 
-    # Helper to move files
-    def move_files(file_list, source_dir, target_dir):
-        for fname in file_list:
-            shutil.move(os.path.join(source_dir, fname), os.path.join(target_dir, fname))
-
-    # Move files into respective folders
-    move_files(train_images, image_dir, os.path.join(output_dir, "train", "images"))
-    move_files(train_labels, label_dir, os.path.join(output_dir, "train", "labels"))
-
-    move_files(val_images, image_dir, os.path.join(output_dir, "valid", "images"))
-    move_files(val_labels, label_dir, os.path.join(output_dir, "valid", "labels"))
-
-    move_files(test_images, image_dir, os.path.join(output_dir, "test", "images"))
-    move_files(test_labels, label_dir, os.path.join(output_dir, "test", "labels"))
+    # Helper to link image and label files straight from their source folders
+    def link_files(file_pairs, split_dir):
+        # Join the directory prefixes once rather than calling os.path.join per file
+        image_prefix = os.path.join(split_dir, "images", "")
+        label_prefix = os.path.join(split_dir, "labels", "")
+        link_pairs = []
+        for image_path, label_path in file_pairs:
+            link_pairs.append((image_path, image_prefix + os.path.basename(image_path)))
+            link_pairs.append((label_path, label_prefix + os.path.basename(label_path)))
+
+        # Linking/copying is I/O bound, so overlap the operations on a thread pool
+        max_workers = min(32, (os.cpu_count() or 1) * 4)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(lambda pair: link_or_copy(*pair), link_pairs))
+
+    # Link files into respective folders
+    link_files(train_files, os.path.join(output_dir, "train"))
+    link_files(val_files, os.path.join(output_dir, "valid"))
+    link_files(test_files, os.path.join(output_dir, "test"))
 
     print(f"Data split completed:")
-    print(f"Train: {len(train_images)} images")
-    print(f"Validation: {len(val_images)} images")
-    print(f"Test: {len(test_images)} images")
+    print(f"Train: {len(train_files)} images")
+    print(f"Validation: {len(val_files)} images")
+    print(f"Test: {len(test_files)} images")
 
 # Perform the split
 output_dir = "data/drowning_resplit"
-split_data(image_dir, label_dir, output_dir)
+split_data(data_dir, output_dir)
@@ -1,42 +1,66 @@
 import os
+import multiprocessing
 import numpy as np
 from PIL import Image
 import scipy.io as sio
 
+def is_hdf5_mat(mat_path):
+    # MATLAB v7.3 files are HDF5 containers and announce themselves in the text header
+    with open(mat_path, 'rb') as f:
+        return f.read(19) == b'MATLAB 7.3 MAT-file'
+
+def load_hdf5_segmentation_map(mat_path, key='MM'):
+    # scipy can't read v7.3 files, so read only the mask dataset through h5py
+    import h5py
+
+    with h5py.File(mat_path, 'r') as f:
+        struct = f[key]
+        # Struct fields are stored as datasets; MATLAB_fields keeps their original order
+        field_name = b''.join(struct.attrs['MATLAB_fields'][0]).decode()
+        # HDF5 stores MATLAB arrays column-major, so transpose back to (H, W)
+        return struct[field_name][()].T
+
 def load_segmentation_map(mat_path, key='MM'):
-    # Load .mat file
-    mat_data = sio.loadmat(mat_path)
+    if is_hdf5_mat(mat_path):
+        return load_hdf5_segmentation_map(mat_path, key)
+
+    # Load only the needed variable from the .mat file
+    mat_data = sio.loadmat(mat_path, variable_names=[key])
     
     # Extract the segmentation mask
     segmentation_map = mat_data[key][0][0][0]  # Assuming 'PartMask' is at this location
     return segmentation_map
 
-def apply_mask(image, mask):
+def binarize_mask(mask):
     # Threshold the mask to create a binary mask
     binary_mask = (mask > 0.5).astype(np.uint8)  # Threshold can be adjusted as needed
     
-    # Ensure the mask is 3D to match the image's shape
+    # Add a channel axis so the mask broadcasts over the image's channels
     if binary_mask.ndim == 2:
-        binary_mask = np.stack([binary_mask] * 4, axis=-1)  # Convert (H, W) to (H, W, 3)
+        binary_mask = binary_mask[..., None]  # Convert (H, W) to (H, W, 1)
     
+    return binary_mask
+
+def apply_mask(image, binary_mask):
     # Apply the binary mask to the image (keeping only the foreground)
-    masked_image = image * binary_mask
+    masked_image = np.multiply(image, binary_mask)
     
     return masked_image
 
 def remove_background_from_image(image_path, mat_path, output_path):
-    # Load the image
-    image = np.array(Image.open(image_path).convert('RGBA'))
+    # Load the image (np.asarray avoids an extra copy; apply_mask writes to a new buffer)
+    image = np.asarray(Image.open(image_path).convert('RGBA'))
 
     # Load the segmentation mask
-    segmentation_map = load_segmentation_map(mat_path)
+    binary_mask = binarize_mask(load_segmentation_map(mat_path))
 
     # Apply the segmentation mask to remove the background
-    masked_image = apply_mask(image, segmentation_map)
+    masked_image = apply_mask(image, binary_mask)
 
     # Save the resulting image with transparent background
+    # (fastest zlib level: these are intermediate files, so encode speed matters more than size)
     result_image = Image.fromarray(masked_image)
-    result_image.save(output_path)
+    result_image.save(output_path, 'PNG', compress_level=1, optimize=False)
 
 # Example usage
 input_dir = "Data/range_without_bg/images"
@@ -45,14 +69,22 @@ output_dir = 'Data/range_without_bg_processed'
 
 
 
-if __name__=='__main__':
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+def process_image(image_name):
+    input_img_path = os.path.join(input_dir, image_name)
+    mask = os.path.join(mask_dir, f"{image_name.split('.')[0]}.mat")
+
+    output_path = os.path.join(output_dir, f"{image_name.split('.')[0]}.png")
+
+    remove_background_from_image(input_img_path, mask, output_path)
 
-    for image_name in os.listdir(input_dir):
-        input_img_path = os.path.join(input_dir, image_name)
-        mask = os.path.join(mask_dir, f"{image_name.split('.')[0]}.mat")
 
-        output_path = os.path.join(output_dir, f"{image_name.split('.')[0]}.png")
+if __name__=='__main__':
+    os.makedirs(output_dir, exist_ok=True)
+
+    with os.scandir(input_dir) as entries:
+        image_names = [entry.name for entry in entries if entry.is_file()]
 
-        remove_background_from_image(input_img_path, mask, output_path)
+    # Images are independent and decode/encode bound, so spread them across processes;
+    # while one worker waits on disk the others keep computing
+    with multiprocessing.Pool(os.cpu_count()) as pool:
+        list(pool.imap_unordered(process_image, image_names, chunksize=8))
@@ -1,33 +1,72 @@
 import os
 import random
+import numpy as np
+from numba import njit, prange
 from PIL import Image
 
-def superimpose_images(human_image_path, background_image_path, output_image_path, position=(0, 0)):
+# libjpeg-turbo's SIMD decoder is much faster for the JPEG backgrounds; fall back to PIL without it
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    jpeg_decoder = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    jpeg_decoder = None
+
+def load_background(background_image_path):
+    """
+    Decode a background image into an (H, W, 3) uint8 RGB array.
+    """
+    # Backgrounds need no alpha channel; only the human's alpha weights the blend
+    if jpeg_decoder is not None and background_image_path.lower().endswith((".jpg", ".jpeg")):
+        with open(background_image_path, "rb") as f:
+            data = f.read()
+        try:
+            return jpeg_decoder.decode(data, pixel_format=TJPF_RGB)
+        except (OSError, ValueError):
+            # JPEGs libjpeg-turbo can't convert to RGB (e.g. CMYK) are left to PIL
+            pass
+    return np.asarray(Image.open(background_image_path).convert("RGB"))
+
+@njit(parallel=True, fastmath=True, cache=True)
+def alpha_blend(background, foreground, x, y):
+    """
+    Alpha blend an RGBA foreground onto an RGB background in place, with its top-left corner at (x, y).
+    """
+    # A single fused pass per pixel instead of NumPy's temporary float buffers
+    height, width = foreground.shape[:2]
+    for i in prange(height):
+        for j in range(width):
+            alpha = foreground[i, j, 3] * (1.0 / 255.0)
+            for c in range(3):
+                # Round to nearest (+0.5 before the truncating cast), matching PIL's paste
+                background[y + i, x + j, c] = np.uint8(
+                    foreground[i, j, c] * alpha + background[y + i, x + j, c] * (1.0 - alpha) + 0.5
+                )
+
+def superimpose_images(human_image, background, output_image_path, position=(0, 0)):
     """
     Superimpose a human image with a transparent background onto an underwater image.
     
     Parameters:
-    - human_image_path: str, path to the human cutout image (PNG)
-    - background_image_path: str, path to the underwater background image (JPG/PNG)
+    - human_image: PIL.Image, the human cutout image in RGBA mode, already resized to fit the background
+    - background: np.ndarray, the decoded underwater background image as an (H, W, 3) uint8 RGB array
     - output_image_path: str, path to save the final superimposed image
     - position: tuple, coordinates (x, y) where the human cutout will be placed on the background
     """
     
-    # Open the human cutout and the underwater background images
-    human_image = Image.open(human_image_path).convert("RGBA")
-    background_image = Image.open(background_image_path).convert("RGBA")
+    bg_height, bg_width = background.shape[:2]
     
-    # Optionally resize the human image to fit the background better (e.g., scaling down)
-    human_image = human_image.resize((int(background_image.width * 0.3), int(background_image.height * 0.3)))
     # Randomly generate the position on the background
-    max_x = background_image.width - background_image.width
-    max_y = background_image.height - background_image.height
+    max_x = bg_width - human_image.width
+    max_y = bg_height - human_image.height
     position = (random.randint(0, max_x), random.randint(0, max_y))
-    # Paste the human image on the background using its alpha channel for transparency
-    background_image.paste(human_image, position, human_image)
+
+    # Alpha blend the human onto the background using its alpha channel for transparency
+    background = background.copy()  # Backgrounds are shared across humans, so blend into a copy
+    x, y = position
+    alpha_blend(background, np.asarray(human_image), x, y)
     
-    # Save the resulting image
-    background_image.save(output_image_path)
+    # Save the resulting image (fastest zlib level; encode speed matters more than file size here)
+    Image.fromarray(background).save(output_image_path, "PNG", compress_level=1, optimize=False)
 
 # Example usage
 human_dir = "Data/range_without_bg_processed"
@@ -37,13 +76,32 @@ output_dir = 'Data/superimposed'
 
 
 if __name__=='__main__':
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Decode every background once instead of once per human image
+    with os.scandir(bg_dir) as entries:
+        backgrounds = [
+            (entry.name, load_background(entry.path))
+            for entry in entries if entry.is_file()
+        ]
+
+    # Humans are scaled relative to the background, so only distinct background sizes need a resize
+    human_sizes = {
+        (int(background.shape[1] * 0.3), int(background.shape[0] * 0.3))
+        for _, background in backgrounds
+    }
 
-    for image_name in os.listdir(human_dir):
-        human_img_path = os.path.join(human_dir, image_name)
-        for bg_name in os.listdir(bg_dir):
-            bg_img_path = os.path.join(bg_dir, bg_name)
+    with os.scandir(human_dir) as entries:
+        human_entries = [entry for entry in entries if entry.is_file()]
 
-        output_path = os.path.join(output_dir, f"{image_name+bg_name}.png")
-        superimpose_images(human_img_path, bg_img_path, output_path)
+    for human_entry in human_entries:
+        image_name = human_entry.name
+        human_image = Image.open(human_entry.path).convert("RGBA")
+        # Resize the human image to fit each background size better (e.g., scaling down)
+        resized_humans = {
+            size: human_image.resize(size, Image.Resampling.BILINEAR) for size in human_sizes
+        }
+        for bg_name, background in backgrounds:
+            human_size = (int(background.shape[1] * 0.3), int(background.shape[0] * 0.3))
+            output_path = os.path.join(output_dir, f"{image_name+bg_name}.png")
+            superimpose_images(resized_humans[human_size], background, output_path)